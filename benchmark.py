@@ -0,0 +1,123 @@
+# -----------------------------------------------------------
+# This program measures the time and memory used by the stages
+# of rect-graph-generator.py and checks the graphs produced
+#
+# Released under GNU Public License (GPL)
+# -----------------------------------------------------------
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+#The generator is loaded from its file since its name is not a valid module name,
+#it is registered in sys.modules so that the processes used by generate() can find it
+spec = importlib.util.spec_from_file_location("rect_graph_generator", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rect-graph-generator.py"))
+rg = importlib.util.module_from_spec(spec)
+sys.modules["rect_graph_generator"] = rg
+spec.loader.exec_module(rg)
+
+#Number of simple flips and T-flips of the flip graph of every n
+EXPECTED_FLIPS = {1: (0, 0), 2: (1, 0), 3: (4, 2), 4: (18, 16), 5: (88, 106), 6: (460, 672), 7: (2532, 4236),
+                  8: (14518, 26876), 9: (86032, 172328), 10: (523818, 1117828)}
+
+def baxter(n):
+    #Returns the Baxter number of n, which is the number of diagonal rectangulations of n rectangles
+    return sum(math.comb(n+1, k-1)*math.comb(n+1, k)*math.comb(n+1, k+1) for k in range(1, n+1)) // (math.comb(n+1, 1)*math.comb(n+1, 2))
+
+def timed(function, *args):
+    #Returns the result of the function and the time it took, the output of the function is discarded
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args)
+    return result, time.perf_counter() - start
+
+def check(n, rects, graph):
+    #Returns the errors found in the graph of n
+    errors = []
+    if len(rects) != baxter(n):
+        errors.append("%d rectangulations instead of %d" % (len(rects), baxter(n)))
+    flips = (sum(1 for edge in graph.edges if edge[2] == "f"), sum(1 for edge in graph.edges if edge[2] == "t"))
+    if n in EXPECTED_FLIPS and flips != EXPECTED_FLIPS[n]:
+        errors.append("%d simple flips and %d T-flips instead of %d and %d" % (flips + EXPECTED_FLIPS[n]))
+    return errors
+
+def bench(n, combinatorial, workers, render, memory):
+    """
+    Measures every stage for n and returns a dictionary of the measures
+
+    generate: the whole generation, pivots: the pivots of all rectangulations,
+    common_edge and find_spot: the time spent in these functions for the coordinates,
+    render: the images drawn by Pillow, graphviz: the writing of the DOT source
+    """
+    measures = {"n": n, "combinatorial": combinatorial}
+    (rects, graph), measures["generate"] = timed(rg.generate, n, combinatorial, workers)
+    measures["rectangulations"] = len(rects)
+    measures["flips"] = len(graph.edges)
+    measures["errors"] = check(n, rects, graph)
+    if memory:
+        tracemalloc.start()
+        timed(rg.generate, n, combinatorial, workers)
+        measures["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    #Time the pivots and, for the coordinates, the time spent finding the spot of the simple flips
+    spent = [0.0]
+    find_spot = rg.find_spot
+    def timed_find_spot(*args):
+        start = time.perf_counter()
+        result = find_spot(*args)
+        spent[0] += time.perf_counter() - start
+        return result
+    rg.find_spot = timed_find_spot
+    try:
+        found, measures["pivots"] = timed(rg.pivot_all, list(rects))
+    finally:
+        rg.find_spot = find_spot
+    measures["pivots_done"] = sum(len(f) for f in found)
+    measures["pivots_per_second"] = measures["pivots_done"] / measures["pivots"] if measures["pivots"] else 0
+    if not combinatorial:
+        measures["find_spot"] = spent[0]
+        pairs = [(r.rects[i], r.rects[j]) for r in rects for i in range(n) for j in range(i+1, n)]
+        _, measures["common_edge"] = timed(lambda: [rg.common_edge(a, b) for a, b in pairs])
+
+    if render:
+        colors = ["red","yellow","blue","orange","purple","green"]
+        with tempfile.TemporaryDirectory() as directory:
+            _, measures["render"] = timed(rg.render, rects, colors, directory, workers)
+    _, measures["graphviz"] = timed(rg.write_dot, rg.flip_graph_events(rects, graph), io.StringIO(), "graph"+str(n))
+    return measures
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the generation and visualisation of diagonal rectangulations")
+    parser.add_argument("--min", type=int, default=3, help="smallest number of rectangles")
+    parser.add_argument("--max", type=int, default=8, help="largest number of rectangles")
+    parser.add_argument("--coordinates", action="store_true", help="use the coordinates instead of the combinatorial rectangulations")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes used by generate() and threads used to render")
+    parser.add_argument("--render-max", type=int, default=6, help="largest number of rectangles for which the images are drawn")
+    parser.add_argument("--memory", action="store_true", help="measure the peak memory of generate() in a second run")
+    parser.add_argument("--json", help="file in which the measures are written")
+    args = parser.parse_args()
+    results = []
+    failed = False
+    for n in range(args.min, args.max+1):
+        measures = bench(n, not args.coordinates, args.workers, n <= args.render_max, args.memory)
+        results.append(measures)
+        stages = " ".join("%s=%.4fs" % (stage, measures[stage]) for stage in ("generate", "pivots", "common_edge", "find_spot", "render", "graphviz") if stage in measures)
+        print("n=%d rectangulations=%d flips=%d %s pivots/s=%.0f%s %s" % (n, measures["rectangulations"], measures["flips"], stages, measures["pivots_per_second"],
+              " peak_memory=%dKiB" % (measures["peak_memory"]//1024) if "peak_memory" in measures else "", "ok" if not measures["errors"] else "; ".join(measures["errors"])))
+        failed = failed or bool(measures["errors"])
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=1)
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
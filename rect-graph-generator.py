@@ -7,8 +7,18 @@
 # email Orestis.Tranganidas@ulb.be
 # -----------------------------------------------------------
 
+import concurrent.futures
+import hashlib
+import inspect
+import math
+import os
+import pickle
+import random
+import struct
+import sys
+import time
+import numpy
 from numpy import sign
-from copy import deepcopy
 from PIL import Image, ImageDraw
 import graphviz
 
@@ -16,30 +26,34 @@ class Rectangle:
     """
     Rectangle object 
     contains the coordinates of the four corners and the label of the rectangle
+
+    the corners are tuples that are replaced instead of changed,
+    so that a copy of the rectangle only copies the references to them
     """
+    __slots__ = ("bottom_left", "bottom_right", "top_left", "top_right", "label")
+
     def __init__(self, bottom_left, bottom_right, top_left, top_right, i):
-        self.bottom_left = bottom_left
-        self.bottom_right = bottom_right
-        self.top_left = top_left
-        self.top_right = top_right
+        self.bottom_left = tuple(bottom_left)
+        self.bottom_right = tuple(bottom_right)
+        self.top_left = tuple(top_left)
+        self.top_right = tuple(top_right)
         self.label = i
     
     #The following functions change the coordinates of the specified corner of the rectangle
     def set_bottom_left(self, p):
-        self.bottom_left[0] = p[0]
-        self.bottom_left[1] = p[1]
+        self.bottom_left = (p[0], p[1])
     
     def set_bottom_right(self, p):
-        self.bottom_right[0] = p[0]
-        self.bottom_right[1] = p[1]
+        self.bottom_right = (p[0], p[1])
         
     def set_top_left(self, p):
-        self.top_left[0] = p[0]
-        self.top_left[1] = p[1]
+        self.top_left = (p[0], p[1])
     
     def set_top_right(self, p):
-        self.top_right[0] = p[0]
-        self.top_right[1] = p[1]
+        self.top_right = (p[0], p[1])
+
+    def copy(self):
+        return Rectangle(self.bottom_left, self.bottom_right, self.top_left, self.top_right, self.label)
 
     #Representation of the rectangle in string form    
     def __repr__(self):
@@ -70,71 +84,44 @@ class Rectangulation:
     
     contains a list of all the rectangles of the rectangulation
     """
-    def __init__(self, n):
-        #Initialization of the first rectangulation
+    def __init__(self, n, rects=None):
+        #Initialization of the first rectangulation, or of the rectangulation made of the given rectangles
+        if rects is not None:
+            self.rects = rects
+            return
         self.rects = []
         size = 100/n
         for i in range(n):
             self.rects.append(Rectangle([0+(size*i),0],[size+(size*i),0],[0+(size*i),100],[size+(size*i),100],i+1))
     
+    def key(self):
+        """
+        Canonical hashable encoding of the rectangulation
+
+        Every inner segment of a diagonal rectangulation crosses the diagonal between two consecutive
+        rectangles, so it can be named by that position (1 to n-1), the borders being 0 and n.
+        The encoding gives for every rectangle the positions of the segments that contain its
+        left, right, top and bottom sides, which does not depend on the actual coordinates
+        """
+        n = len(self.rects)
+        #The first rectangle touches the top left corner and the last one the bottom right corner
+        xs = {self.rects[0].bottom_left[0]: 0, self.rects[-1].bottom_right[0]: n}
+        ys = {self.rects[0].top_left[1]: 0, self.rects[-1].bottom_right[1]: n}
+        for k in range(1, n):
+            if self.rects[k-1].bottom_right[0] == self.rects[k].bottom_left[0]:
+                xs[self.rects[k-1].bottom_right[0]] = k
+            else:
+                ys[self.rects[k-1].bottom_left[1]] = k
+        return (tuple(xs[r.bottom_left[0]] for r in self.rects), tuple(xs[r.bottom_right[0]] for r in self.rects),
+                tuple(ys[r.top_left[1]] for r in self.rects), tuple(ys[r.bottom_left[1]] for r in self.rects))
+
+    def __hash__(self):
+        return hash(self.key())
+
     def __eq__(self, other):
         #Returns if two rectangulations are equivalent
-        same = True
-        for i in range(len(self.rects)):
-            self_top = []
-            self_left = []
-            self_bottom = []
-            self_right = []
-            other_top = []
-            other_left = []
-            other_bottom = []
-            other_right = []
-            """
-            For every rectangle in the first rectangulation 
-            checks if the rectangle with the same label in the second rectangulation
-            comes in contact with the same rectangles
-            """
-            for j in range(len(self.rects)):
-                if i != j:
-                    if self.rects[j].bottom_right[1] == self.rects[i].top_right[1]:
-                        if self.rects[i].top_left[0] <= self.rects[j].bottom_right[0] <= self.rects[i].top_right[0] or \
-                           self.rects[i].top_left[0] <= self.rects[j].bottom_left[0] <= self.rects[i].top_right[0]:
-                            self_top.append(self.rects[j].label)
-                    elif self.rects[j].bottom_right[0] == self.rects[i].top_left[0]:
-                        if self.rects[i].top_left[1] <= self.rects[j].bottom_right[1] <= self.rects[i].bottom_left[1] or \
-                           self.rects[i].top_left[1] <= self.rects[j].top_right[1] <= self.rects[i].bottom_left[1]:
-                            self_left.append(self.rects[j].label)
-                    elif self.rects[j].bottom_left[0] == self.rects[i].top_right[0]:
-                        if self.rects[i].top_right[1] <= self.rects[j].bottom_left[1] <= self.rects[i].bottom_right[1] or \
-                           self.rects[i].top_right[1] <= self.rects[j].top_left[1] <= self.rects[i].bottom_right[1]:
-                            self_right.append(self.rects[j].label)
-                    elif self.rects[j].top_right[1] == self.rects[i].bottom_right[1]:
-                        if self.rects[i].bottom_left[0] <= self.rects[j].top_right[0] <= self.rects[i].bottom_right[0] or \
-                           self.rects[i].bottom_left[0] <= self.rects[j].top_left[0] <= self.rects[i].bottom_right[0]:
-                            self_bottom.append(self.rects[j].label)
-                    
-                    if other.rects[j].bottom_right[1] == other.rects[i].top_right[1]:
-                        if other.rects[i].top_left[0] <= other.rects[j].bottom_right[0] <= other.rects[i].top_right[0] or \
-                           other.rects[i].top_left[0] <= other.rects[j].bottom_left[0] <= other.rects[i].top_right[0]:
-                            other_top.append(other.rects[j].label)
-                    elif other.rects[j].bottom_right[0] == other.rects[i].top_left[0]:
-                        if other.rects[i].top_left[1] <= other.rects[j].bottom_right[1] <= other.rects[i].bottom_left[1] or \
-                           other.rects[i].top_left[1] <= other.rects[j].top_right[1] <= other.rects[i].bottom_left[1]:
-                            other_left.append(other.rects[j].label)
-                    elif other.rects[j].bottom_left[0] == other.rects[i].top_right[0]:
-                        if other.rects[i].top_right[1] <= other.rects[j].bottom_left[1] <= other.rects[i].bottom_right[1] or \
-                           other.rects[i].top_right[1] <= other.rects[j].top_left[1] <= other.rects[i].bottom_right[1]:
-                            other_right.append(other.rects[j].label)
-                    elif other.rects[j].top_right[1] == other.rects[i].bottom_right[1]:
-                        if other.rects[i].bottom_left[0] <= other.rects[j].top_right[0] <= other.rects[i].bottom_right[0] or \
-                           other.rects[i].bottom_left[0] <= other.rects[j].top_left[0] <= other.rects[i].bottom_right[0]:
-                            other_bottom.append(other.rects[j].label)
-                    
-                    if (self_top != other_top) or (self_left != other_left) or (self_bottom != other_bottom) or (self_right != other_right):
-                        same = False
-                        break
-        return same
-    
+        return isinstance(other, Rectangulation) and self.key() == other.key()
+
     def __repr__(self):
         #String representation of the rectangulation
         result = ""
@@ -142,53 +129,1144 @@ class Rectangulation:
             result += str(i)
             result += "\n"
         return result
-        
-def generate(n):
-    #Function that generates all rectangulations
-    r = Rectangulation(n)
-    results = []#List of all generated rectangulations
-    not_tested = []#Queue of all rectangulations that have not been used
-    results.append(r)
-    not_tested.append(r)
-    adj_matrix = [[0]]#Matrix containing the relations between rectangulations
-    while len(not_tested) > 0:
+
+    def copy(self, *changed):
+        #Returns a copy of the rectangulation in which only the rectangles in changed are copied, the others are shared
+        rects = list(self.rects)
+        for i in changed:
+            rects[i] = rects[i].copy()
+        return Rectangulation(len(rects), rects)
+
+    def to_rectangulation(self):
+        return self
+
+class DiagonalRectangulation:
+    """
+    Combinatorial rectangulation object
+
+    contains for every rectangle the positions of the segments that contain its left, right, top and bottom sides,
+    which is the encoding given by Rectangulation.key(), instead of the coordinates of its corners.
+    Pivots are performed by changing these positions and the coordinates are only computed when they are needed
+    """
+    __slots__ = ("left", "right", "top", "bottom")
+
+    def __init__(self, n=0, key=None):
+        #Initialization of the first rectangulation, or of the rectangulation with the given key
+        if key is None:
+            key = (tuple(range(n)), tuple(range(1, n+1)), (0,)*n, (n,)*n)
+        self.left, self.right, self.top, self.bottom = key
+
+    def key(self):
+        return (self.left, self.right, self.top, self.bottom)
+
+    def __len__(self):
+        return len(self.left)
+
+    def __eq__(self, other):
+        return isinstance(other, DiagonalRectangulation) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return "DiagonalRectangulation(key=%s)" % (self.key(),)
+
+    def pivots(self):
+        #Yields the result of the pivot of every pair of rectangles that come in contact and the kind of flip performed
+        n = len(self)
+        for i in range(n):
+            for j in range(i+1, n):
+                result = self.pivot(i, j)
+                if result is not None:
+                    yield result
+
+    def pivot(self, a, b, vertical=None):
         """
-        While there are unused rectangulations take the top of the queue
+        Perform a pivot between rectangles a and b, with a before b in the ordering
+
+        vertical can be given if it is already known that the rectangles come in contact and how, as found by contacts()
+
+        return the result and the kind of flip that was performed,
+        return None if the rectangles do not come in contact or if the result is not a diagonal rectangulation
+        """
+        left, right, top, bottom = self.left, self.right, self.top, self.bottom
+        if vertical is None:
+            if right[a] == left[b] and max(top[a], top[b]) < min(bottom[a], bottom[b]):
+                vertical = True
+            elif bottom[a] == top[b] and max(left[a], left[b]) < min(right[a], right[b]):
+                vertical = False
+            else:
+                return None
+        if vertical:
+        #The common edge is vertical, a is on the left
+            left, right, top, bottom = list(left), list(right), list(top), list(bottom)
+            if top[a] == top[b] and bottom[a] == bottom[b]:
+                #Simple flip, a goes on top of b
+                bottom[a] = top[b] = right[a]
+                right[a] = right[b]
+                left[b] = left[a]
+                kind = "f"
+            elif bottom[a] == bottom[b]:
+                #T-flip around the bottom corner, the shorter rectangle extends under the taller one
+                if top[a] < top[b]:
+                    bottom[a] = top[b]
+                    left[b] = left[a]
+                else:
+                    bottom[b] = top[a]
+                    right[a] = right[b]
+                kind = "t"
+            elif top[a] == top[b]:
+                #T-flip around the top corner, the shorter rectangle extends over the taller one
+                if bottom[a] > bottom[b]:
+                    top[a] = bottom[b]
+                    left[b] = left[a]
+                else:
+                    top[b] = bottom[a]
+                    right[a] = right[b]
+                kind = "t"
+            else:
+                return None
+        else:
+        #The common edge is horizontal, a is on top
+            left, right, top, bottom = list(left), list(right), list(top), list(bottom)
+            if left[a] == left[b] and right[a] == right[b]:
+                #Simple flip, a goes on the left of b
+                right[a] = left[b] = bottom[a]
+                bottom[a] = bottom[b]
+                top[b] = top[a]
+                kind = "f"
+            elif left[a] == left[b]:
+                #T-flip around the left corner, the narrower rectangle extends next to the wider one
+                if right[a] > right[b]:
+                    top[b] = top[a]
+                    left[a] = right[b]
+                else:
+                    bottom[a] = bottom[b]
+                    left[b] = right[a]
+                kind = "t"
+            elif right[a] == right[b]:
+                #T-flip around the right corner, the narrower rectangle extends next to the wider one
+                if left[a] < left[b]:
+                    top[b] = top[a]
+                    right[a] = left[b]
+                else:
+                    bottom[a] = bottom[b]
+                    right[b] = left[a]
+                kind = "t"
+            else:
+                return None
+        #The rectangles must still cross the diagonal and the segments around them must separate consecutive rectangles
+        n = len(left)
+        for i in (a, b):
+            if not (left[i] <= i < right[i] and top[i] <= i < bottom[i]):
+                return None
+        for k in {a, a+1, b, b+1}:
+            if 0 < k < n and not ((right[k-1] == k and left[k] == k) or (bottom[k-1] == k and top[k] == k)):
+                return None
+        return DiagonalRectangulation(key=(tuple(left), tuple(right), tuple(top), tuple(bottom))), kind
+
+    def potential(self):
+        #Returns the sum of the widths minus the heights of the rectangles, the first rectangulation is the only one with the smallest value
+        return sum(self.right[i]-self.left[i]-self.bottom[i]+self.top[i] for i in range(len(self)))
+
+    def parent(self):
         """
+        Returns the parent of the rectangulation in the tree used by iter_reverse_search()
+        and the pair of rectangles a < b pivoted to obtain it
+
+        the parent is the result of the first pivot that decreases the potential, returns None for the first rectangulation
+        """
+        n = len(self)
+        potential = self.potential()
+        for a in range(n):
+            for b in range(a+1, n):
+                result = self.pivot(a, b)
+                if result is not None and result[0].potential() < potential:
+                    return result[0], a, b
+        return None
+
+    def transposed(self):
+        #Returns the reflection of the rectangulation across the diagonal, which exchanges the rows and the columns
+        return DiagonalRectangulation(key=(self.top, self.bottom, self.left, self.right))
+
+    def rotated(self):
+        #Returns the rectangulation rotated by 180 degrees, which reverses the order of the rectangles
+        n = len(self)
+        return DiagonalRectangulation(key=tuple(tuple(n-k for k in reversed(side)) for side in (self.right, self.left, self.bottom, self.top)))
+
+    def symmetries(self):
+        #Returns the images of the rectangulation by the four symmetries that keep the diagonal, starting with itself
+        rotated = self.rotated()
+        return [self, self.transposed(), rotated, rotated.transposed()]
+
+    def canonical(self):
+        #Returns the representative of the orbit of the rectangulation, the image with the smallest key
+        return min(self.symmetries(), key=DiagonalRectangulation.key)
+
+    def children(self):
+        """
+        Returns the rectangulations of n+1 rectangles obtained by inserting a new last rectangle in the bottom right corner
+
+        the new rectangle is either a column under the top of one of the rectangles on the right border,
+        which then end on its left side, or a row after the left side of one of the rectangles on the bottom border.
+        Removing the last rectangle of a rectangulation of n+1 rectangles gives back a single rectangulation,
+        so the children of all rectangulations of n rectangles are all rectangulations of n+1 rectangles, each once
+        """
+        n = len(self)
+        if n == 0:
+            return [DiagonalRectangulation(1)]
+        left, right, top, bottom = self.left, self.right, self.top, self.bottom
+        children = []
+        for c in range(n):
+            if right[c] == n:
+                children.append(DiagonalRectangulation(key=(left + (n,), tuple(n+1 if right[i] == n and i < c else right[i] for i in range(n)) + (n+1,),
+                                                            top + (top[c],), tuple(n+1 if k == n else k for k in bottom) + (n+1,))))
+        for c in range(n):
+            if bottom[c] == n:
+                children.append(DiagonalRectangulation(key=(left + (left[c],), tuple(n+1 if k == n else k for k in right) + (n+1,),
+                                                            top + (n,), tuple(n+1 if bottom[i] == n and i < c else bottom[i] for i in range(n)) + (n+1,))))
+        return children
+
+    def to_rectangulation(self):
+        #Returns the rectangulation with the coordinates of the corners of every rectangle
+        n = len(self)
+        size = 100/n
+        rects = []
         for i in range(n):
-            for j in range(i+1, n):
-                #Find all pairs of rectangles that come in contact and their common edge
-                edge = common_edge(not_tested[0].rects[i], not_tested[0].rects[j])
-                if edge != ([0,0],[0,0]):
-                    temp,r = pivot(deepcopy(not_tested[0]), i, j, edge)
-                    if temp not in results:
-                        """
-                        If the resulting rectangulation is new increase the adjacency matrix
-                        and add the new rectangulation to the queue
-                        """
-                        print("New")
-                        results.append(temp)
-                        not_tested.append(temp)
-                        for k in range(len(adj_matrix)):
-                            if k == results.index(not_tested[0]):
-                                adj_matrix[k].append(r)
-                            else:
-                                adj_matrix[k].append(0)
-                        adj_matrix.append([0 if x != not_tested[0] else 1 for x in results])
-                    elif temp != not_tested[0]:
-                        """
-                        If the resulting rectangulation has been generated before
-                        add the relation between the two rectangulations to the adjacency matrix
-                        """
-                        print("Old")
-                        adj_matrix[results.index(temp)][results.index(not_tested[0])] = r
-                        adj_matrix[results.index(not_tested[0])][results.index(temp)] = r
-        if len(not_tested) > 0:
-            not_tested.pop(0)
-    return results, adj_matrix
+            x0, x1 = size*self.left[i], size*self.right[i]
+            y0, y1 = 100-size*self.bottom[i], 100-size*self.top[i]
+            rects.append(Rectangle([x0,y0],[x1,y0],[x0,y1],[x1,y1],i+1))
+        return Rectangulation(n, rects)
+
+class FlipGraph:
+    """
+    Flip graph object
+
+    contains the number of rectangulations and the flips between them as a list of edges (u, v, kind),
+    with u < v the positions of the rectangulations and kind "f" for simple flips or "t" for T-flips.
+    A graph read from a cache file keeps the flips in the memory-mapped arrays until the list is used.
+    The neighbours of the rectangulations are only stored, as compressed arrays, once kind() or neighbours() is used
+    """
+    kinds = {"f": 1, "t": 2}#Numerical codes of the kinds of flips used in the exported matrices
+
+    def __init__(self):
+        self.edge_list = []
+        self.arrays = None#First ends, second ends and kind codes of the flips not yet in the list
+        self.nodes = 0
+        self.adjacency = None#Offsets of the neighbours of every rectangulation, the neighbours and the kind codes of the flips
+
+    @classmethod
+    def from_arrays(cls, nodes, rows, cols, codes):
+        #Returns the graph of nodes rectangulations whose flips are given by arrays as returned by to_arrays(), the arrays are not copied
+        graph = cls()
+        graph.nodes = nodes
+        graph.arrays = (rows, cols, codes)
+        return graph
+
+    @property
+    def edges(self):
+        #List of the flips, the flips that are only in the arrays are added to it the first time it is used
+        if self.arrays is not None:
+            names = {code: kind for kind, code in self.kinds.items()}
+            rows, cols, codes = self.arrays
+            self.edge_list = [(u, v, names[code]) for u, v, code in zip(rows.tolist(), cols.tolist(), codes.tolist())] + self.edge_list
+            self.arrays = None
+        return self.edge_list
+
+    def __len__(self):
+        return self.nodes
+
+    def add_node(self):
+        #Adds a new rectangulation to the graph and returns its position
+        self.nodes += 1
+        self.adjacency = None
+        return self.nodes-1
+
+    def add_edge(self, u, v, kind):
+        #Adds the flip between two rectangulations, the flips are not checked for duplicates since the search finds each one once
+        self.edges.append((min(u, v), max(u, v), kind))
+        self.adjacency = None
+
+    def build_adjacency(self):
+        #Returns the neighbours of every rectangulation in compressed sparse row form, built from the edges the first time
+        if self.adjacency is None:
+            rows, cols, codes = self.to_arrays()
+            ends = numpy.concatenate((rows, cols))
+            order = numpy.argsort(ends, kind="stable")
+            offsets = numpy.zeros(len(self)+1, dtype=numpy.int64)
+            numpy.cumsum(numpy.bincount(ends, minlength=len(self)), out=offsets[1:])
+            self.adjacency = (offsets, numpy.concatenate((cols, rows))[order], numpy.concatenate((codes, codes))[order])
+        return self.adjacency
+
+    def neighbours(self, u):
+        #Returns a dictionary of the neighbours of a rectangulation and the kind of flip leading to them
+        offsets, others, codes = self.build_adjacency()
+        names = {code: kind for kind, code in self.kinds.items()}
+        return {v: names[code] for v, code in zip(others[offsets[u]:offsets[u+1]].tolist(), codes[offsets[u]:offsets[u+1]].tolist())}
+
+    def kind(self, u, v):
+        #Returns the kind of flip between two rectangulations, 0 if they are not related
+        return self.neighbours(u).get(v, 0)
+
+    def to_matrix(self):
+        #Returns the dense adjacency matrix of the graph
+        matrix = [[0]*len(self) for _ in range(len(self))]
+        for u, v, kind in self.edges:
+            matrix[u][v] = kind
+            matrix[v][u] = kind
+        return matrix
+
+    def to_arrays(self):
+        #Returns the edges as three NumPy arrays containing the first ends, the second ends and the kinds of the flips
+        if self.arrays is not None and not self.edge_list:
+            return self.arrays
+        edges = numpy.array([(u, v, self.kinds[kind]) for u, v, kind in self.edges], dtype=numpy.int64).reshape(-1, 3)
+        return edges[:, 0], edges[:, 1], edges[:, 2].astype(numpy.int8)
+
+    def to_sparse(self):
+        #Returns the symmetric adjacency matrix of the graph as a SciPy sparse matrix containing the kind codes of the flips
+        from scipy.sparse import coo_matrix
+        rows, cols, kinds = self.to_arrays()
+        return coo_matrix((numpy.concatenate((kinds, kinds)), (numpy.concatenate((rows, cols)), numpy.concatenate((cols, rows)))),
+                          shape=(len(self), len(self))).tocsr()
+
+def key_array(rects):
+    #Returns the keys of a list of rectangulations as a NumPy array of shape (number of rectangulations, 4, n)
+    return numpy.array([r.key() for r in rects], dtype=numpy.int32).reshape(len(rects), 4, -1)
+
+def contacts(keys):
+    """
+    Finds all pairs of rectangles that come in contact in a batch of rectangulations at once
+
+    keys is an array of keys as returned by key_array(), a single key of shape (4, n) is treated as a batch of one.
+    Returns four arrays with an entry for every pair in contact: the position of the rectangulation in the batch,
+    the two rectangles i < j and whether their common edge is vertical (i is then on the left of j) or horizontal (i is on top of j).
+    The pairs are ordered by rectangulation, then by i and then by j
+    """
+    keys = numpy.asarray(keys)
+    if keys.ndim == 2:
+        keys = keys[numpy.newaxis]
+    left, right, top, bottom = keys[:, 0], keys[:, 1], keys[:, 2], keys[:, 3]
+    i, j = numpy.triu_indices(keys.shape[2], 1)
+    vertical = (right[:, i] == left[:, j]) & (numpy.maximum(top[:, i], top[:, j]) < numpy.minimum(bottom[:, i], bottom[:, j]))
+    horizontal = (bottom[:, i] == top[:, j]) & (numpy.maximum(left[:, i], left[:, j]) < numpy.minimum(right[:, i], right[:, j]))
+    batch, pair = numpy.nonzero(vertical | horizontal)
+    return batch, i[pair], j[pair], vertical[batch, pair]
+
+def iter_pivots(rects):
+    """
+    Yields (k, a, b, result, kind) for every pivot of the rectangulations of the list, k being the position of the rectangulation
+
+    the pairs of rectangles in contact in combinatorial rectangulations are all found at once by contacts()
+    """
+    if len(rects) == 0 or not isinstance(rects[0], DiagonalRectangulation):
+        for k, rect in enumerate(rects):
+            n = len(rect.rects)
+            for a in range(n):
+                for b in range(a+1, n):
+                    edge = common_edge(rect.rects[a], rect.rects[b])
+                    if edge != ((0,0),(0,0)):
+                        yield (k, a, b) + pivot(rect, a, b, edge)
+        return
+    batch, first, second, vertical = contacts(key_array(rects))
+    for k, a, b, v in zip(batch.tolist(), first.tolist(), second.tolist(), vertical.tolist()):
+        result = rects[k].pivot(a, b, v)
+        if result is not None:
+            yield (k, a, b) + result
+
+def pivot_all(rects):
+    #Returns for every rectangulation of the list the results of all its pivots and the kinds of flips performed
+    found = [[] for _ in rects]
+    for k, a, b, temp, r in iter_pivots(rects):
+        found[k].append((temp, r))
+    return found
+
+def pivot_keys(rects):
+    """
+    Returns for every rectangulation of the list the keys of the results of all its pivots, used by the processes of generate()
+
+    every result is given as (key, kind, a, b), a and b being the rectangles pivoted, so that only small tuples are sent back
+    to the main process, which creates the new rectangulations with rebuild()
+    """
+    found = [[] for _ in rects]
+    for k, a, b, temp, r in iter_pivots(rects):
+        found[k].append((temp.key(), r, a, b))
+    return found
+
+def rebuild(rect, key, a, b):
+    #Returns the result of a pivot found by pivot_keys(), from its key for combinatorial rectangulations and by pivoting a and b again otherwise
+    if isinstance(rect, DiagonalRectangulation):
+        return DiagonalRectangulation(key=key)
+    return pivot(rect, a, b, common_edge(rect.rects[a], rect.rects[b]))[0]
+
+class Stats:
+    """
+    Stats object
+
+    contains the counters of a generation: the pivots performed, the flips of each kind, the new rectangulations found,
+    the flips leading to rectangulations already found, the number of levels, the size of the current level
+    and the time spent pivoting and merging the results.
+    progress is called with the stats after every chunk of rectangulations used
+    and if interval is given a summary is written to stream (stderr by default) every interval seconds.
+    Nothing is counted when no Stats object is given to the generation
+    """
+    def __init__(self, progress=None, interval=None, stream=None):
+        self.pivots = 0
+        self.flips = {"f": 0, "t": 0}
+        self.new = 0
+        self.duplicates = 0
+        self.used = 0
+        self.levels = 0
+        self.frontier = 0
+        self.timings = {"pivot": 0.0, "merge": 0.0}
+        self.progress = progress
+        self.interval = interval
+        self.stream = stream
+        self.reported = time.monotonic()
+
+    def count(self, chunk, new, pivot_time, merge_time):
+        #Adds the results of the pivots of a chunk of rectangulations, new being the number of new rectangulations found
+        for found in chunk:
+            self.pivots += len(found)
+            for result in found:
+                if result[1] in self.flips:
+                    self.flips[result[1]] += 1
+        self.new += new
+        self.duplicates = self.flips["f"] + self.flips["t"] - self.new
+        self.used += len(chunk)
+        self.timings["pivot"] += pivot_time
+        self.timings["merge"] += merge_time
+        if self.progress is not None:
+            self.progress(self)
+        if self.interval is not None and time.monotonic() - self.reported >= self.interval:
+            print(self, file=self.stream if self.stream is not None else sys.stderr)
+            self.reported = time.monotonic()
+
+    def __repr__(self):
+        return "used:% s new:% s duplicates:% s pivots:% s flips:% s T-flips:% s level:% s frontier:% s pivot time:%.3fs merge time:%.3fs" % (
+            self.used, self.new, self.duplicates, self.pivots, self.flips["f"], self.flips["t"], self.levels, self.frontier,
+            self.timings["pivot"], self.timings["merge"])
+
+def iter_flip_graph(n, combinatorial=False, workers=None, resume=None, stats=None):
+    """
+    Generator that yields the rectangulations and the flips between them as soon as they are found
+
+    yields ("node", u, rect) for every new rectangulation, u being its position,
+    ("edge", u, v, kind) for every flip between the rectangulations u < v
+    and ("expanded", p) when everything found from the rectangulations before position p has been yielded.
+    Only the keys of the rectangulations found and the current level of the search are kept in memory.
+    resume can be a pair (rectangulations, p) of the rectangulations already found and of the position p of an "expanded" event,
+    the search then continues from there and only yields what was not found before.
+    stats can be a Stats object in which the generation is counted.
+    The other arguments are the same as for generate()
+    """
+    if resume is None:
+        r = DiagonalRectangulation(n) if combinatorial else Rectangulation(n)
+        index = {r.key(): 0}#Position of every generated rectangulation, indexed by its key
+        level = [r]#Rectangulations that have not been used
+        start = 0#Position of the first rectangulation of the level
+        yield ("node", 0, r)
+    else:
+        found, start = resume
+        index = {found[k].key(): k for k in range(len(found))}
+        level = list(found[start:])
+    pool = concurrent.futures.ProcessPoolExecutor(workers) if workers and workers > 1 else None
+    try:
+        while len(level) > 0:
+            """
+            While there are unused rectangulations pivot all pairs of rectangles that come in contact
+            in every rectangulation of the current level
+            """
+            if pool is None:
+                size = 256
+            else:
+                size = max(1, -(-len(level)//(4*workers)))
+            chunks = [level[k:k+size] for k in range(0, len(level), size)]
+            next_level = []
+            current = start
+            if stats is not None:
+                stats.levels += 1
+                stats.frontier = len(level)
+                mark = time.perf_counter()
+            for rects, chunk in zip(chunks, (map if pool is None else pool.map)(pivot_keys, chunks)):
+                if stats is not None:
+                    pivoted = time.perf_counter()
+                    known = len(index)
+                for rect, found in zip(rects, chunk):
+                    for key, r, a, b in found:
+                        if key not in index:
+                            """
+                            If the resulting rectangulation is new create it from its key,
+                            yield it and add it to the next level
+                            """
+                            index[key] = len(index)
+                            temp = rebuild(rect, key, a, b)
+                            next_level.append(temp)
+                            yield ("node", index[key], temp)
+                            yield ("edge", current, index[key], r)
+                        elif index[key] > current:
+                            """
+                            If the resulting rectangulation has been generated before but has not been used yet
+                            yield the relation between the two rectangulations,
+                            the flips to the rectangulations already used have been found from them
+                            """
+                            yield ("edge", current, index[key], r)
+                    current += 1
+                if stats is not None:
+                    stats.count(chunk, len(index) - known, pivoted - mark, time.perf_counter() - pivoted)
+                yield ("expanded", current)
+                if stats is not None:
+                    mark = time.perf_counter()
+            start += len(level)
+            level = next_level
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def generate(n, combinatorial=False, workers=None, checkpoint=None, interval=600, stats=None):
+    """
+    Function that generates all rectangulations
+
+    uses the coordinates of the rectangles by default
+    and the combinatorial DiagonalRectangulation if combinatorial is True.
+    If workers is larger than 1 the pivots of every level of the search are computed by that many processes,
+    the results are merged in the same order so the rectangulations and the graph are the same as with one process.
+    If checkpoint is a path the state of the search is saved there every interval seconds,
+    a later call with the same arguments continues from the saved state and the file is removed at the end.
+    stats can be a Stats object in which the generation is counted
+    """
+    results = []#List of all generated rectangulations
+    graph = FlipGraph()#Graph containing the relations between rectangulations
+    resume = load_checkpoint(checkpoint, n, combinatorial) if checkpoint is not None else None
+    if resume is not None:
+        results, edges, position = resume
+        for _ in results:
+            graph.add_node()
+        for edge in edges:
+            graph.add_edge(*edge)
+        resume = (results, position)
+    saved = time.monotonic()
+    for event in iter_flip_graph(n, combinatorial, workers, resume, stats):
+        if event[0] == "node":
+            graph.add_node()
+            results.append(event[2])
+        elif event[0] == "edge":
+            graph.add_edge(*event[1:])
+        elif checkpoint is not None and time.monotonic() - saved >= interval:
+            save_checkpoint(checkpoint, n, combinatorial, results, graph, event[1])
+            saved = time.monotonic()
+    if checkpoint is not None and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return results, graph
+
+def save_checkpoint(path, n, combinatorial, results, graph, position):
+    #Saves the rectangulations and the flips found so far and the position of the first rectangulation that has not been used
+    with open(path + ".tmp", "wb") as file:
+        pickle.dump((CACHE_VERSION, flip_logic_digest(), n, combinatorial, results, graph.edges, position), file)
+    os.replace(path + ".tmp", path)
+
+def load_checkpoint(path, n, combinatorial):
+    """
+    Loads the state saved by save_checkpoint() as the rectangulations, the flips and the position
+
+    returns None if there is no checkpoint, or if it was saved for other arguments or by another version of the flip logic
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as file:
+        version, digest, size, comb, results, edges, position = pickle.load(file)
+    if version != CACHE_VERSION or digest != flip_logic_digest() or size != n or comb != combinatorial:
+        return None
+    return results, edges, position
+
+def write_flip_graph(n, path, binary=False, combinatorial=False, workers=None, stats=None):
+    """
+    Writes the rectangulations and the flips between them to a file as soon as they are found
+
+    In text form every rectangulation is a line "n u key" and every flip a line "e u v kind",
+    the key being the 4n numbers of the key of the rectangulation separated by spaces.
+    In binary form every rectangulation is the byte "n", u as a 4 byte unsigned integer and the key as 4n bytes,
+    and every flip is its kind ("f" or "t") followed by u and v as 4 byte unsigned integers.
+    Returns the number of rectangulations and flips written
+    """
+    nodes = edges = 0
+    with open(path, "wb" if binary else "w") as file:
+        for event in iter_flip_graph(n, combinatorial, workers, stats=stats):
+            if event[0] == "node":
+                key = [k for side in event[2].key() for k in side]
+                if binary:
+                    file.write(struct.pack("<cI%dB" % len(key), b"n", event[1], *key))
+                else:
+                    file.write("n %d %s\n" % (event[1], " ".join(map(str, key))))
+                nodes += 1
+            elif event[0] == "edge":
+                if binary:
+                    file.write(struct.pack("<cII", event[3].encode(), event[1], event[2]))
+                else:
+                    file.write("e %d %d %s\n" % event[1:])
+                edges += 1
+    return nodes, edges
+
+def flip_graph_events(rects, graph):
+    #Yields the rectangulations and the flips of a graph that is already known as the events of iter_flip_graph()
+    for u in range(len(rects)):
+        yield ("node", u, rects[u])
+    for u, v, kind in graph.edges:
+        yield ("edge", u, v, kind)
+
+def key_string(rect):
+    #Returns the key of a rectangulation as a string, the four sides separated by "/"
+    return "/".join(",".join(str(k) for k in side) for side in rect.key())
+
+def dot_string(text):
+    #Returns a string quoted for the DOT language
+    return '"' + str(text).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+EDGE_COLORS = {"f": "red", "t": "blue"}#Colors of the simple flips and of the T-flips in the drawings of the graph
+
+def write_dot(events, file, name="graph", images=None, labels=False, large=False):
+    """
+    Writes the flip graph given by the events of iter_flip_graph() to an open file in the DOT language of Graphviz
+
+    the lines are written as the events come, no graphviz.Graph is built.
+    images can be the paths of the images drawn in the nodes and labels tells whether the nodes show their positions.
+    If large is True the graph is set up for sfdp and the nodes are drawn as points.
+    Returns the number of rectangulations and of flips written
+    """
+    nodes = edges = 0
+    file.write("graph %s {\n" % dot_string(name))
+    if large:
+        file.write("\tgraph [layout=sfdp outputorder=edgesfirst overlap=false]\n\tnode [shape=point label=\"\"]\n\tedge [penwidth=0.5]\n")
+    else:
+        file.write("\tnode [shape=box label=\"\"]\n")
+    for event in events:
+        if event[0] == "node":
+            attributes = ""
+            if images is not None and not large:
+                attributes += " image=%s" % dot_string(images[event[1]])
+            if labels:
+                attributes += " label=%d" % event[1]
+            file.write("\t%d%s\n" % (event[1], " [%s]" % attributes.strip() if attributes else ""))
+            nodes += 1
+        elif event[0] == "edge":
+            file.write("\t%d -- %d [color=%s]\n" % (event[1], event[2], EDGE_COLORS[event[3]]))
+            edges += 1
+    file.write("}\n")
+    return nodes, edges
+
+def write_graphml(events, file):
+    """
+    Writes the flip graph given by the events of iter_flip_graph() to an open file in the GraphML format
+
+    every node has its key as data "key" and every edge its kind as data "kind"
+    """
+    nodes = edges = 0
+    file.write('<?xml version="1.0" encoding="UTF-8"?>\n<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+               '<key id="key" for="node" attr.name="key" attr.type="string"/>\n'
+               '<key id="kind" for="edge" attr.name="kind" attr.type="string"/>\n'
+               '<graph id="flips" edgedefault="undirected">\n')
+    for event in events:
+        if event[0] == "node":
+            file.write('<node id="n%d"><data key="key">%s</data></node>\n' % (event[1], key_string(event[2])))
+            nodes += 1
+        elif event[0] == "edge":
+            file.write('<edge source="n%d" target="n%d"><data key="kind">%s</data></edge>\n' % event[1:])
+            edges += 1
+    file.write("</graph>\n</graphml>\n")
+    return nodes, edges
+
+def write_edge_list(events, file, separator=" ", header=False):
+    """
+    Writes the flips given by the events of iter_flip_graph() to an open file, one flip "u v kind" per line
+
+    with separator="," and header=True the file is a CSV file with the columns source, target and kind
+    """
+    nodes = edges = 0
+    if header:
+        file.write(separator.join(("source", "target", "kind")) + "\n")
+    for event in events:
+        if event[0] == "node":
+            nodes += 1
+        elif event[0] == "edge":
+            file.write("%d%s%d%s%s\n" % (event[1], separator, event[2], separator, event[3]))
+            edges += 1
+    return nodes, edges
+
+def export_flip_graph(n, path, format=None, combinatorial=False, workers=None, stats=None):
+    """
+    Generates the flip graph of n and writes it to a file as soon as the search finds it, like write_flip_graph()
+
+    format is "dot", "graphml", "edges" or "csv", by default it is given by the extension of the path (.gv is also DOT).
+    The DOT file has no images and is set up for sfdp. Returns the number of rectangulations and of flips written
+    """
+    if format is None:
+        format = {".gv": "dot", ".dot": "dot", ".graphml": "graphml", ".csv": "csv"}.get(os.path.splitext(path)[1], "edges")
+    writers = {"dot": lambda events, file: write_dot(events, file, "graph"+str(n), large=True),
+               "graphml": write_graphml,
+               "edges": write_edge_list,
+               "csv": lambda events, file: write_edge_list(events, file, ",", True)}
+    if format not in writers:
+        raise ValueError("unknown format %r" % format)
+    with open(path, "w") as file:
+        return writers[format](iter_flip_graph(n, combinatorial, workers, stats=stats), file)
+
+def iter_reverse_search(n):
+    """
+    Generator that yields every combinatorial rectangulation of n rectangles once, using only O(n) memory
+
+    The rectangulations form a tree rooted at DiagonalRectangulation(n) in which the parent of a rectangulation
+    is given by DiagonalRectangulation.parent(), since every other rectangulation has a pivot that decreases the potential
+    (checked for all rectangulations of up to 10 rectangles).
+    The tree is traversed depth first without storing it: every step is a pivot, either to a child of the current rectangulation
+    or back to its parent, after which the search continues with the next pair of rectangles of the parent
+    """
+    current = DiagonalRectangulation(n)
+    yield current
+    a, b = 0, 1#Next pair of rectangles to pivot in the current rectangulation
+    while True:
+        if b >= n:
+            a, b = a+1, a+2
+        if a < n-1:
+            result = current.pivot(a, b)
+            b += 1
+            if result is not None and result[0].potential() > current.potential():
+                parent = result[0].parent()
+                if parent is not None and parent[0].key() == current.key():
+                    #Go down to the child
+                    current = result[0]
+                    a, b = 0, 1
+                    yield current
+        else:
+            #Go back up to the parent and continue with the pair after the one leading to the current rectangulation
+            parent = current.parent()
+            if parent is None:
+                return
+            current, a, b = parent[0], parent[1], parent[2]+1
+
+class Orbits:
+    """
+    Orbits object
+
+    contains a representative of every orbit of the rectangulations under the reflection across the diagonal
+    and the rotation by 180 degrees, which map the flip graph onto itself,
+    the size of every orbit, the number of distinct simple flips and T-flips of every representative
+    and the graph of the flips between the orbits, which has one edge for every kind of flip between two orbits,
+    so two orbits related by both a simple flip and a T-flip are joined by two edges
+    """
+    def __init__(self, n):
+        self.n = n
+        self.representatives = []
+        self.sizes = []
+        self.degrees = []
+        self.graph = FlipGraph()
+
+    def counts(self):
+        #Returns the number of rectangulations, of simple flips and of T-flips of the whole flip graph
+        simple = sum(size*degree[0] for size, degree in zip(self.sizes, self.degrees)) // 2
+        t = sum(size*degree[1] for size, degree in zip(self.sizes, self.degrees)) // 2
+        return sum(self.sizes), simple, t
+
+    def expand(self):
+        """
+        Returns all rectangulations and the whole flip graph like generate()
+
+        the rectangulations of every orbit follow each other in the order of the representatives,
+        the flips are found by pivoting only the representatives and applying the symmetries to the results
+        """
+        results = []
+        index = {}
+        graph = FlipGraph()
+        flips = set()#Flips already added, found from both ends and from several images
+        for rep in self.representatives:
+            for image in rep.symmetries():
+                if image.key() not in index:
+                    index[image.key()] = graph.add_node()
+                    results.append(image)
+        for rep in self.representatives:
+            images = rep.symmetries()
+            for temp,r in rep.pivots():
+                for image, result in zip(images, temp.symmetries()):
+                    u, v = index[image.key()], index[result.key()]
+                    if u != v and (min(u, v), max(u, v)) not in flips:
+                        flips.add((min(u, v), max(u, v)))
+                        graph.add_edge(u, v, r)
+        return results, graph
+
+def generate_orbits(n):
+    """
+    Function that generates one combinatorial rectangulation of every orbit under the symmetries
+
+    only the representatives are pivoted and kept, which divides the work and the memory by up to four,
+    returns an Orbits object from which the counts or the whole graph can be obtained
+    """
+    orbits = Orbits(n)
+    r = DiagonalRectangulation(n).canonical()
+    index = {r.key(): orbits.graph.add_node()}#Position of every representative, indexed by its key
+    orbits.representatives.append(r)
+    current = 0
+    while current < len(orbits.representatives):
+        rep = orbits.representatives[current]
+        orbits.sizes.append(len({image.key() for image in rep.symmetries()}))
+        neighbours = {}
+        linked = set()#Later representatives already linked to this one and the kinds of the flips linking them
+        for temp,r in rep.pivots():
+            if temp.key() != rep.key():
+                neighbours.setdefault(temp.key(), r)
+            canonical = temp.canonical()
+            if canonical.key() not in index:
+                index[canonical.key()] = orbits.graph.add_node()
+                orbits.representatives.append(canonical)
+            if index[canonical.key()] > current and (index[canonical.key()], r) not in linked:
+                linked.add((index[canonical.key()], r))
+                orbits.graph.add_edge(current, index[canonical.key()], r)
+        kinds = list(neighbours.values())
+        orbits.degrees.append((kinds.count("f"), kinds.count("t")))
+        current += 1
+    return orbits
+
+def binomial(n, k):
+    #Binomial coefficient that is 0 outside of 0 <= k <= n
+    return math.comb(n, k) if 0 <= k <= n else 0
+
+STEPS = [(a, b, c) for a in (0, 1) for b in (0, 1) for c in (0, 1)]#Possible steps of the three paths
+
+def step_weights(rows):
+    """
+    Returns for every step in STEPS the number of ways to complete the three paths after it
+
+    it is the determinant of the 3x3 matrix of binomials given by the rows, expanded along the first row
+    so that the minors of the two other rows are shared by both steps of the first path
+    """
+    minors = {}
+    for b in (0, 1):
+        for c in (0, 1):
+            (d, e, f), (g, h, i) = rows[1][1-b:4-b], rows[2][1-c:4-c]
+            minors[b, c] = (e*i - f*h, d*i - f*g, d*h - e*g)
+    weights = []
+    for a, b, c in STEPS:
+        x, y, z = rows[0][1-a:4-a]
+        minor = minors[b, c]
+        weights.append(x*minor[0] - y*minor[1] + z*minor[2])
+    return weights
+
+def upper_segments(horizontal, up, n):
+    """
+    Returns the positions of the top and right sides of the rectangles given by a path
+
+    horizontal[k] tells whether the segment k is horizontal and up[k] whether the path goes up at k (for 1 <= k < n).
+    A horizontal segment where the path stays flat can be ended by the next vertical segment where the path goes up,
+    which also ends the horizontal segments where the path goes up since then, the other segments end at the border
+    """
+    ends = [0]*(n+1)
+    stack = []#Horizontal segments not yet ended, with whether a vertical segment can end them
+    for k in range(1, n):
+        if horizontal[k]:
+            stack.append((k, not up[k]))
+        else:
+            if up[k]:
+                while True:
+                    j, matched = stack.pop()
+                    ends[j] = k
+                    if matched:
+                        break
+            ends[k] = stack[-1][0] if stack else 0
+    for j, matched in stack:
+        ends[j] = n
+    top = tuple(0 if i == 0 else i if horizontal[i] else ends[i] for i in range(n))
+    right = tuple(n if i == n-1 else ends[i+1] if horizontal[i+1] else i+1 for i in range(n))
+    return top, right
+
+def random_rectangulation(n, rng=None):
+    """
+    Function that returns a uniformly random combinatorial rectangulation of n rectangles without generating the others
+
+    The rectangulations with k-1 horizontal segments correspond one to one to the triples of paths f1 <= f2 <= f3
+    of n-1 steps going up k-1 times. f2 tells which segments are horizontal, f1 how the segments end above the diagonal
+    and f3 how they end below it (checked against generate() for up to 7 rectangles).
+    k is drawn with the weight of its number of triples and every step of the paths with the number of ways to complete them,
+    which is a determinant of binomials, so every rectangulation has the same probability. This takes O(n) operations on integers of O(n) bits.
+    rng is a random.Random object, by default the module random is used
+    """
+    if rng is None:
+        rng = random
+    if n == 0:
+        return DiagonalRectangulation(0)
+    #Draw k using the number of triples, which is proportional to C(n+1,k-1)*C(n+1,k)*C(n+1,k+1)
+    row = [1]#C(n+1,0), C(n+1,1), ...
+    for k in range(n+1):
+        row.append(row[-1]*(n+1-k)//(k+1))
+    weights = [row[k-1]*row[k]*row[k+1] for k in range(1, n+1)]
+    choice = rng.randrange(sum(weights))
+    for k, weight in enumerate(weights, 1):
+        if choice < weight:
+            break
+        choice -= weight
+    #The paths are shifted so that they do not touch, path i is at height heights[i] and ends at k-1+i,
+    #rows[i] holds C(r, k-1+j-heights[i]) for j = -1..2 where r is the number of remaining steps
+    heights = [0, 1, 2]
+    rows = [[binomial(n-1, k-1+j-i) for j in range(-1, 3)] for i in range(3)]
+    paths = ([None], [None], [None])#Steps of the three paths, starting at the segment 1
+    for r in range(n-1, 0, -1):
+        #One step less: C(r-1,x) = C(r,x)*(r-x)/r
+        for i in range(3):
+            x = k-2-heights[i]
+            rows[i] = [value*(r-x-j)//r for j, value in enumerate(rows[i])]
+        weights = step_weights(rows)
+        choice = rng.randrange(sum(weights))
+        for steps, weight in zip(STEPS, weights):
+            if choice < weight:
+                break
+            choice -= weight
+        for i, step in enumerate(steps):
+            paths[i].append(bool(step))
+            if step:
+                #Going up shifts the binomials: C(r-1,x-1) = C(r-1,x)*x/(r-x)
+                x = k-2-heights[i]
+                value = rows[i][0]
+                rows[i] = [value*x//(r-x) if value else binomial(r-1, x-1)] + rows[i][:3]
+                heights[i] += 1
+    top, right = upper_segments(paths[1], paths[0], n)
+    left, bottom = upper_segments([not h for h in paths[1]], [not up for up in paths[2]], n)
+    return DiagonalRectangulation(key=(left, right, top, bottom))
+
+def random_rectangulations(n, count, seed=None):
+    #Returns a list of count uniformly random rectangulations of n rectangles, the same seed always gives the same list
+    rng = random.Random(seed)
+    return [random_rectangulation(n, rng) for i in range(count)]
+
+def shortest_flip_path(a, b):
+    """
+    Function that returns a shortest sequence of flips from the rectangulation a to the rectangulation b
+
+    the neighbours are found by pivoting the rectangulations when they are reached, with pivot_all(), in a breadth first search
+    from both ends that always extends the smaller side by a whole level, so only the balls around a and b are visited.
+    a and b can both use the coordinates or both be combinatorial, the rectangulations of the path then have the same type.
+    Returns the list of the rectangulations of the path, starting with a and ending with b, and the list of the kinds of the flips,
+    or None if b cannot be reached
+    """
+    if len(a.key()[0]) != len(b.key()[0]):
+        return None
+    if a.key() == b.key():
+        return [a], []
+    #For both sides, the rectangulation of every key reached, the key it was reached from, the kind of that flip and the number of flips from the end
+    reached = ({a.key(): (a, None, None, 0)}, {b.key(): (b, None, None, 0)})
+    levels = ([a], [b])
+    while levels[0] and levels[1]:
+        side = 0 if len(levels[0]) <= len(levels[1]) else 1
+        seen, other = reached[side], reached[1-side]
+        best = None#Key reached by both sides with the shortest path
+        next_level = []
+        #Pivot the level in chunks so that the arrays of contacts() stay small for large n
+        size = max(1, 2**16 // len(a.key()[0])**2)
+        found = [result for k in range(0, len(levels[side]), size) for result in pivot_all(levels[side][k:k+size])]
+        for rect, results in zip(levels[side], found):
+            for temp,r in results:
+                key = temp.key()
+                if key in seen:
+                    continue
+                seen[key] = (temp, rect.key(), r, seen[rect.key()][3]+1)
+                next_level.append(temp)
+                if key in other and (best is None or other[key][3] < other[best][3]):
+                    best = key
+        if best is not None:
+            #Follow the keys back to a and to b
+            forward, backward = (seen, other) if side == 0 else (other, seen)
+            path, kinds = [], []
+            key = best
+            while key is not None:
+                temp, previous, r = forward[key][:3]
+                path.append(temp)
+                kinds.append(r)
+                key = previous
+            path.reverse()
+            kinds = kinds[-2::-1]
+            key = best
+            while backward[key][1] is not None:
+                key, r = backward[key][1], backward[key][2]
+                path.append(backward[key][0])
+                kinds.append(r)
+            return path, kinds
+        levels = (next_level, levels[1]) if side == 0 else (levels[0], next_level)
+    return None
+
+def flip_distance(a, b):
+    #Returns the smallest number of flips between two rectangulations, or None if b cannot be reached from a
+    result = shortest_flip_path(a, b)
+    return None if result is None else len(result[1])
+
+CACHE_VERSION = 1#Version of the format of the cache files
+CACHE_HEADER = struct.Struct("<8sIIIQQ20s")#Magic, version, n, combinatorial, number of rectangulations and of flips, digest of the flip logic
+
+def flip_logic_digest():
+    """
+    Returns a digest of the source of the functions that produce what save_flip_graph() stores
+
+    it changes when the first rectangulations, the order of the search, the flips or the coordinates of the results change
+    """
+    functions = [generate, iter_flip_graph, iter_pivots, pivot_keys, rebuild, contacts, key_array, flip_edges, generate_tree,
+                 Rectangulation.__init__, Rectangulation.key, Rectangulation.copy, Rectangle.__init__, Rectangle.copy,
+                 DiagonalRectangulation.__init__, DiagonalRectangulation.pivot, DiagonalRectangulation.children, DiagonalRectangulation.to_rectangulation,
+                 common_edge, pivot, flip, find_spot, t_flip]
+    return hashlib.sha1("".join(inspect.getsource(f) for f in functions).encode()).digest()
+
+class CachedRectangulations:
+    """
+    Sequence of the rectangulations stored in a cache file
+
+    the keys and the coordinates are memory-mapped and the rectangulations are only created when they are accessed
+    """
+    def __init__(self, keys, coordinates=None):
+        self.keys = keys
+        self.coordinates = coordinates
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self[i] for i in range(*k.indices(len(self)))]
+        if self.coordinates is None:
+            return DiagonalRectangulation(key=tuple(tuple(side) for side in self.keys[k].tolist()))
+        return Rectangulation(self.coordinates.shape[1], [Rectangle(c[0:2], c[2:4], c[4:6], c[6:8], i+1)
+                                                          for i, c in enumerate(self.coordinates[k].tolist())])
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+def save_flip_graph(path, n, results, graph, combinatorial=False):
+    """
+    Writes the rectangulations and the flip graph to a cache file
+
+    the file contains the header, the keys of the rectangulations as bytes,
+    the coordinates of their corners as doubles unless they are combinatorial,
+    and the edges as two arrays of 4 byte unsigned integers followed by their kinds as bytes (1 for "f", 2 for "t")
+    """
+    rows, cols, kinds = graph.to_arrays()
+    with open(path + ".tmp", "wb") as file:
+        file.write(CACHE_HEADER.pack(b"RECTGRPH", CACHE_VERSION, n, int(combinatorial), len(results), len(rows), flip_logic_digest()))
+        file.write(key_array(results).astype(numpy.uint8).tobytes())
+        if not combinatorial:
+            file.write(numpy.array([[r.bottom_left + r.bottom_right + r.top_left + r.top_right for r in rect.rects] for rect in results],
+                                   dtype=numpy.float64).tobytes())
+        file.write(rows.astype(numpy.uint32).tobytes())
+        file.write(cols.astype(numpy.uint32).tobytes())
+        file.write(kinds.astype(numpy.uint8).tobytes())
+    os.replace(path + ".tmp", path)
+
+def load_flip_graph(path, n, combinatorial=False, edges=True):
+    """
+    Reads the rectangulations and the flip graph from a cache file written by save_flip_graph()
+
+    returns None if the file does not exist, was written for other arguments or by another version of the flip logic,
+    if edges is False only the rectangulations are read and None is returned instead of the graph
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as file:
+        header = file.read(CACHE_HEADER.size)
+    if len(header) < CACHE_HEADER.size:
+        return None
+    magic, version, size, comb, nodes, flips, digest = CACHE_HEADER.unpack(header)
+    if magic != b"RECTGRPH" or version != CACHE_VERSION or size != n or comb != int(combinatorial) or digest != flip_logic_digest():
+        return None
+    if os.path.getsize(path) != CACHE_HEADER.size + nodes*4*n + (0 if combinatorial else nodes*n*8*8) + flips*9:
+        #The file was cut short or has extra data
+        return None
+    offset = CACHE_HEADER.size
+    keys = numpy.memmap(path, dtype=numpy.uint8, mode="r", offset=offset, shape=(nodes, 4, n)) if nodes*n > 0 else numpy.zeros((nodes, 4, n), dtype=numpy.uint8)
+    offset += nodes*4*n
+    coordinates = None
+    if not combinatorial:
+        coordinates = numpy.memmap(path, dtype=numpy.float64, mode="r", offset=offset, shape=(nodes, n, 8)) if nodes*n > 0 else numpy.zeros((nodes, n, 8))
+        offset += nodes*n*8*8
+    if not edges:
+        return CachedRectangulations(keys, coordinates), None
+    if flips > 0:
+        rows = numpy.memmap(path, dtype=numpy.uint32, mode="r", offset=offset, shape=(flips,))
+        cols = numpy.memmap(path, dtype=numpy.uint32, mode="r", offset=offset+4*flips, shape=(flips,))
+        codes = numpy.memmap(path, dtype=numpy.uint8, mode="r", offset=offset+8*flips, shape=(flips,))
+        graph = FlipGraph.from_arrays(nodes, rows, cols, codes)
+    else:
+        graph = FlipGraph.from_arrays(nodes, numpy.zeros(0, dtype=numpy.uint32), numpy.zeros(0, dtype=numpy.uint32), numpy.zeros(0, dtype=numpy.uint8))
+    return CachedRectangulations(keys, coordinates), graph
+
+def load_or_generate(n, combinatorial=False, workers=None, directory="cache"):
+    """
+    Returns the rectangulations and the flip graph like generate(),
+    reading them from the cache file of n in directory if it is up to date and writing it otherwise
+    """
+    path = os.path.join(directory, "graph%d-%s.bin" % (n, "combinatorial" if combinatorial else "coordinates"))
+    cached = load_flip_graph(path, n, combinatorial)
+    if cached is not None:
+        return cached
+    results, graph = generate(n, combinatorial, workers)
+    os.makedirs(directory, exist_ok=True)
+    save_flip_graph(path, n, results, graph, combinatorial)
+    return results, graph
+
+def flip_edges(results, workers=None):
+    """
+    Returns the flip graph of a list containing all rectangulations of n rectangles
+
+    every rectangulation is pivoted once, by that many processes if workers is larger than 1
+    """
+    index = {results[k].key(): k for k in range(len(results))}
+    graph = FlipGraph()
+    for _ in results:
+        graph.add_node()
+    if workers and workers > 1:
+        size = max(1, -(-len(results)//(4*workers)))
+    else:
+        size = 256
+    chunks = [list(results[k:k+size]) for k in range(0, len(results), size)]
+    pool = concurrent.futures.ProcessPoolExecutor(workers) if workers and workers > 1 else None
+    try:
+        current = 0
+        for chunk in (map if pool is None else pool.map)(pivot_keys, chunks):
+            for found in chunk:
+                for key, r, a, b in found:
+                    if index[key] > current:
+                        graph.add_edge(current, index[key], r)
+                current += 1
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return graph
+
+def generate_tree(n, combinatorial=False, workers=None, directory="cache"):
+    """
+    Function that generates all rectangulations of n rectangles from those of n-1 rectangles
+
+    the rectangulations of the largest size below n found in the cache directory are read, or the search starts from the empty rectangulation,
+    and the children given by DiagonalRectangulation.children() are taken one size at a time up to n.
+    Only the flips of the rectangulations of n rectangles are computed, and they are written to the cache,
+    so generating n = 3, 4, ... in turn costs about as much as the last size.
+    The rectangulations are numbered in the order of the tree instead of the order of generate().
+    The other arguments are the same as for load_or_generate()
+    """
+    def path(m):
+        return os.path.join(directory, "tree%d-%s.bin" % (m, "combinatorial" if combinatorial else "coordinates"))
+    cached = load_flip_graph(path(n), n, combinatorial)
+    if cached is not None:
+        return cached
+    level = [DiagonalRectangulation(0)]
+    for m in range(n-1, 0, -1):
+        cached = load_flip_graph(path(m), m, combinatorial, edges=False)
+        if cached is not None:
+            level = list(CachedRectangulations(cached[0].keys))
+            break
+    while len(level[0]) < n:
+        level = [child for rect in level for child in rect.children()]
+    if not combinatorial:
+        level = [rect.to_rectangulation() for rect in level]
+    graph = flip_edges(level, workers)
+    os.makedirs(directory, exist_ok=True)
+    save_flip_graph(path(n), n, level, graph, combinatorial)
+    return level, graph
 
 def common_edge(a, b):
-    #Returns the common edge of two rectangles if it exists, otherwise returns ([0,0],[0,0])
+    #Returns the common edge of two rectangles if it exists, otherwise returns ((0,0),(0,0))
     #Compares the corners of the rectangles
     if a.bottom_right == b.bottom_left:
         if (a.top_right[1] >= b.top_left[1]) and (a.top_right[0] == b.top_left[0]):
@@ -221,7 +1299,7 @@ def common_edge(a, b):
     elif a.top_left == b.bottom_left:
         if (a.top_right[0] >= b.bottom_right[0]) and (a.top_right[1] == b.bottom_right[1]):
             return a.get_top_edge()            
-    return ([0,0],[0,0])
+    return ((0,0),(0,0))
     
 def pivot(rect, a, b, edge):
     """
@@ -229,46 +1307,47 @@ def pivot(rect, a, b, edge):
     
     return the result and the kind of flip that was performed if it was performed,
     return the original rectangulation otherwise 
+    the original rectangulation is not changed, the result is a copy sharing all rectangles except a and b
     """
     if edge == rect.rects[a].get_top_edge():
         if edge == rect.rects[b].get_bottom_edge():
-            return flip(rect,a,b,False,True),"f"
+            return flip(rect.copy(a,b),a,b,False,True),"f"
                 
         elif rect.rects[a].top_left == rect.rects[b].bottom_left:
-            return t_flip(rect,a,b,edge,False,True),"t"
+            return t_flip(rect.copy(a,b),a,b,edge,False,True),"t"
             
     elif edge == rect.rects[a].get_left_edge():
         if edge == rect.rects[b].get_right_edge():
-            return flip(rect,a,b,True,False),"f"
+            return flip(rect.copy(a,b),a,b,True,False),"f"
             
         elif rect.rects[a].top_left == rect.rects[b].top_right:
-            return t_flip(rect,a,b,edge,True,False),"t"
+            return t_flip(rect.copy(a,b),a,b,edge,True,False),"t"
             
     elif edge == rect.rects[a].get_bottom_edge():
         if edge == rect.rects[b].get_top_edge():
-            return flip(rect,a,b,False,False),"f"
+            return flip(rect.copy(a,b),a,b,False,False),"f"
             
         elif rect.rects[a].bottom_right == rect.rects[b].top_right:
-            return t_flip(rect,a,b,edge,False,False),"t"
+            return t_flip(rect.copy(a,b),a,b,edge,False,False),"t"
             
     elif edge == rect.rects[a].get_right_edge():
         if edge == rect.rects[b].get_left_edge():
-            return flip(rect,a,b,True,True),"f"
+            return flip(rect.copy(a,b),a,b,True,True),"f"
             
         elif rect.rects[a].bottom_right == rect.rects[b].bottom_left:
-            return t_flip(rect,a,b,edge,True,True),"t"
+            return t_flip(rect.copy(a,b),a,b,edge,True,True),"t"
             
     elif edge == rect.rects[b].get_top_edge() and rect.rects[a].bottom_left == rect.rects[b].top_left:
-        return t_flip(rect,a,b,edge,False,False),"t"
+        return t_flip(rect.copy(a,b),a,b,edge,False,False),"t"
         
     elif edge == rect.rects[b].get_left_edge() and rect.rects[a].top_right == rect.rects[b].top_left:
-        return t_flip(rect,a,b,edge,True,True),"t"
+        return t_flip(rect.copy(a,b),a,b,edge,True,True),"t"
         
     elif edge == rect.rects[b].get_bottom_edge() and rect.rects[a].top_right == rect.rects[b].bottom_right:
-        return t_flip(rect,a,b,edge,False,True),"t"
+        return t_flip(rect.copy(a,b),a,b,edge,False,True),"t"
         
     elif edge == rect.rects[b].get_right_edge() and rect.rects[a].bottom_left == rect.rects[b].bottom_right:
-        return t_flip(rect,a,b,edge,True,False),"t"
+        return t_flip(rect.copy(a,b),a,b,edge,True,False),"t"
         
     return rect,0
 
@@ -280,7 +1359,6 @@ def flip(rect,a,b,vertical,afirst):
     then, change the coordinates of the corners of the two rectangles so that they are separated by the new edge
     and their order in the rectangulation has been changed
     """
-    print("Flip")
     if vertical:
     #The common edge is vertical
         middle = (rect.rects[a].bottom_left[1] + rect.rects[a].top_left[1])/2
@@ -375,7 +1453,6 @@ def t_flip(rect,a,b,edge,vertical,afirst):
     Change the coordinates of the corners of the two rectangles so that they are separated by the new edge
     and their order in the rectangulation has been changed
     """
-    print("T-flip")
     if vertical:
     #The common edge is vertical
         if afirst:
@@ -430,31 +1507,89 @@ def t_flip(rect,a,b,edge,vertical,afirst):
                 rect.rects[a].set_top_right(rect.rects[b].top_left)
     return rect
         
+def draw_rectangulation(rect, colors):
+    #Returns the image of a rectangulation produced using Pillow, the rectangles are filled with the colors in order
+    rect = rect.to_rectangulation()
+    im = Image.new('RGB', (100, 100), (255, 255, 255))
+    draw = ImageDraw.Draw(im)
+    for i in range(len(rect.rects)):
+        draw.rectangle((rect.rects[i].top_left[0], 100-rect.rects[i].top_left[1],
+                        rect.rects[i].bottom_right[0], 100-rect.rects[i].bottom_right[1]),outline="black",fill=colors[i % len(colors)],width=2)
+    draw.line((0,0,100,100),fill=(0,0,0),width=2)
+    return im
+
+def image_name(rect, colors):
+    #Returns the name of the image of a rectangulation, it only depends on its key and on the colors used
+    return hashlib.sha1(repr((type(rect).__name__, rect.key(), colors)).encode()).hexdigest() + ".png"
+
+def render_image(rect, colors, path):
+    #Draws the image of a rectangulation unless it already exists
+    if not os.path.exists(path):
+        draw_rectangulation(rect, colors).save(path + ".tmp", format="PNG")
+        os.replace(path + ".tmp", path)
+    return path
+
+def render(rects, colors, directory="images", workers=None):
+    """
+    Draws the images of all rectangulations in directory and returns their paths
+
+    the images are named after the keys of the rectangulations, so the images drawn by previous runs are reused.
+    The images are drawn and encoded by a pool of workers threads
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = [os.path.join(directory, image_name(rect, colors)) for rect in rects]
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        list(pool.map(render_image, rects, [colors]*len(rects), paths))
+    return paths
+
+def render_sprite(rects, colors, path, columns=None):
+    """
+    Draws the images of all rectangulations in a single sprite sheet instead of one file per rectangulation
+
+    the image of rectangulation k is in row k // columns and column k % columns, each image being 100 by 100 pixels.
+    Returns the number of columns used
+    """
+    if columns is None:
+        columns = max(1, math.ceil(math.sqrt(len(rects))))
+    sheet = Image.new('RGB', (100*columns, 100*max(1, math.ceil(len(rects)/columns))), (255, 255, 255))
+    for k in range(len(rects)):
+        sheet.paste(draw_rectangulation(rects[k], colors), (100*(k % columns), 100*(k // columns)))
+    sheet.save(path)
+    return columns
+
+LARGE_GRAPH = 500#Number of rectangulations above which render_flip_graph() uses sfdp and draws no images
+
+def render_flip_graph(rects, graph, name, colors, format="png", view=False, large=None, sprite=False):
+    """
+    Draws the flip graph with Graphviz, its DOT source being written directly to the file name.gv
+
+    if large is True, or if large is None and there are more than LARGE_GRAPH rectangulations, the graph is laid out by sfdp,
+    the nodes are points without images and the viewer is never opened, so that it can run in batch jobs without a display.
+    Otherwise the nodes contain the images drawn by render(), or their positions if sprite is True, and the result is opened if view is True.
+    Returns the path of the drawing
+    """
+    if large is None:
+        large = len(rects) > LARGE_GRAPH
+    images = None
+    if not large and not sprite:
+        images = render(rects, colors)
+    with open(name + ".gv", "w") as file:
+        write_dot(flip_graph_events(rects, graph), file, name, images, sprite, large)
+    path = graphviz.render("sfdp" if large else "dot", format, name + ".gv", outfile=name + "." + format)
+    if view and not large:
+        graphviz.view(path)
+    return path
+
 def main():
     n = 3#Choose number of rectangles used
+    combinatorial = True#Choose whether the combinatorial rectangulations are used instead of the coordinates
+    sprite = False#Choose whether the images are drawn in a single sprite sheet instead of the nodes of the graph
     colors = ["red","yellow","blue","orange","purple","green"]#List of colors to be used in visualization
-    rects, mat = generate(n)
-    #For each rectangulation produce a image using Pillow and the corresponding node using Graphviz
-    dot = graphviz.Graph("graph"+str(n),format="png")
-    for rect in range(len(rects)):
-        im = Image.new('RGB', (100, 100), (255, 255, 255))
-        draw = ImageDraw.Draw(im)
-        for i in range(len(rects[rect].rects)):
-            draw.rectangle((rects[rect].rects[i].bottom_left[0], 100-rects[rect].rects[i].bottom_left[1],
-                            rects[rect].rects[i].top_right[0], 100-rects[rect].rects[i].top_right[1]),outline="black",fill=colors[i],width=2)
-        draw.line((0,0,100,100),fill=(0,0,0),width=2)
-        im.save(str(rect)+".png", quality=95)
-        dot.node(str(rect), shape="box", label="", image=str(rect)+".png")
-    #Draw the edges between two nodes on Graphviz based on the adjacency matrix
-    for i in range(len(mat)):
-        for j in range(i+1,len(mat[i])):
-            if mat[i][j] == "f":
-                dot.edge(str(i),str(j),color="red")
-            elif mat[i][j] == "t":
-                dot.edge(str(i),str(j),color="blue")
-    dot.render(directory="", view=True)
+    rects, graph = load_or_generate(n, combinatorial)
+    #Draw the rectangulations using Pillow and the flip graph using Graphviz, red for simple flips and blue for T-flips
+    if sprite:
+        render_sprite(rects, colors, "graph"+str(n)+"-sprite.png")
+    render_flip_graph(rects, graph, "graph"+str(n), colors, view=True, sprite=sprite)
     
 if __name__ == '__main__':
     main()
-    
-    